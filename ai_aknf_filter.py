@@ -15,6 +15,9 @@
 # (rich è opzionale per output colorato)
 
 import os
+import io
+import mmap
+import codecs
 import argparse
 # Importa lxml.etree e lo usa come ET per minimizzare le modifiche al codice esistente
 try:
@@ -26,16 +29,38 @@ except ImportError:
     LXML_AVAILABLE = False
 import re
 import google.generativeai as genai
+from google.generativeai.types import HarmCategory, HarmBlockThreshold, GenerationConfig
+from google.api_core import exceptions as google_exceptions
 from pathlib import Path
 from dotenv import load_dotenv
 import sys
 import time
-import html
+import random
 import threading
-import itertools
+import collections
+import hashlib
+import gzip
+import json
+import tempfile
+import sqlite3
+import contextlib
+import functools
+import operator
+import types
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # --- Script Configuration ---
 SCRIPT_VERSION = "1.0.15" # Updated version
+# Marker nel nome dei DAT generati dallo script (esclusi dalla ricerca con --all)
+GENERATED_MARKER = "(GeminiAKNF"
+# Suffisso dei DAT generati, es. "Nintendo - Game Boy (GeminiAKNF 1.0.15).dat"
+OUTPUT_TAG = f"{GENERATED_MARKER} {SCRIPT_VERSION})"
+# File di debug/intermedi scritti nella directory di lavoro, mai da processare
+EXCLUDED_SUFFIXES = ("_compressed.xml", "_ai_response.xml",
+                     "failed_ai_response_games.xml",
+                     "invalid_ai_response_start.xml",
+                     "failed_ai_response.xml")
 
 # Importa Rich per output colorato
 try:
@@ -43,12 +68,27 @@ try:
     from rich.progress import Progress, SpinnerColumn, TextColumn
     from rich.panel import Panel
     from rich.text import Text
-    console = Console()
+
+    def create_console(stderr=False):
+        """Crea la console (su stdout o stderr) e lo spinner delle chiamate API che la usa."""
+        new_console = Console(stderr=stderr)
+        # Spinner delle chiamate API: un solo thread di rendering per tutti i worker, disattivato se l'output non è un terminale
+        new_progress = Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"),
+                                console=new_console, transient=True, disable=not new_console.file.isatty())
+        return new_console, new_progress
+
+    console, progress = create_console()
     RICH_AVAILABLE = True
 except ImportError:
     RICH_AVAILABLE = False
     # Fallback a print normale se rich non è installato
     class ConsoleFallback:
+        # print() non è atomico tra thread: serializza le scritture dei worker
+        _lock = threading.Lock()
+
+        def __init__(self, file=None):
+            self.file = file # None = sys.stdout corrente
+
         def print(self, *args, **kwargs):
             filtered_args = []
             for arg in args:
@@ -57,20 +97,42 @@ except ImportError:
                 except Exception:
                     filtered_args.append(f"[Impossibile convertire l'argomento: {type(arg)}]")
             kwargs.pop('style', None)
-            print(*filtered_args, **kwargs)
+            kwargs.pop('highlight', None)
+            kwargs.pop('markup', None)
+            with self._lock:
+                print(*filtered_args, file=self.file, **kwargs)
+
+    # Senza rich nessuno spinner: stessa interfaccia di Progress, senza effetti
+    class ProgressFallback:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
 
-    console = ConsoleFallback()
+        def add_task(self, description, **kwargs):
+            return None
+
+        def remove_task(self, task_id):
+            pass
+
+    def create_console(stderr=False):
+        """Crea la console (su stdout o stderr) e lo spinner (assente) delle chiamate API."""
+        return ConsoleFallback(sys.stderr if stderr else None), ProgressFallback()
+
+    console, progress = create_console()
     Panel = lambda text, title, border_style: f"\n--- {title} ---\n{text}\n-------------"
     Text = str
 
-# Avviso se lxml non è disponibile
-if not LXML_AVAILABLE:
+# Avviso se lxml non è disponibile (eseguito come script l'avviso è stampato dal main, sulla console scelta)
+if not LXML_AVAILABLE and __name__ not in ("__main__", "__mp_main__"):
     console.print("[yellow]Avviso:[/yellow] Libreria 'lxml' non trovata. Uso 'xml.etree.ElementTree' standard.")
     console.print("         Si raccomanda 'lxml' per performance e robustezza: [bold]pip install lxml[/bold]")
 
 
 # --- Configurazione API Gemini ---
-load_dotenv()
+# Le variabili già presenti nell'ambiente hanno la precedenza sul file .env
+load_dotenv(override=False)
 API_KEY = os.getenv("GOOGLE_API_KEY")
 
 if not API_KEY:
@@ -81,40 +143,61 @@ genai.configure(api_key=API_KEY)
 
 # Modello Gemini da usare
 GEMINI_MODEL_NAME = "gemini-2.0-flash" # Modello specificato dall'utente
+# Limite richieste al minuto verso l'API (quota per chiave, 0 = nessun limite)
+GEMINI_RPM_LIMIT = 15
+# Tentativi aggiuntivi (con backoff esponenziale) quando l'API risponde 429 / RESOURCE_EXHAUSTED
+GEMINI_MAX_RETRIES = 5
 
 # Configurazione Generazione
-generation_config = {
-  "temperature": 0.2,
-  "top_p": 0.95,
-  "top_k": 64,
-  "max_output_tokens": 8192,
-  "response_mime_type": "text/plain",
-}
-safety_settings = [
-    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-]
+# Oggetti costruiti una sola volta (tipi nativi dell'SDK, in sola lettura) e passati al modello condiviso
+generation_config = GenerationConfig(
+    temperature=0.2,
+    top_p=0.95,
+    top_k=64,
+    max_output_tokens=8192,
+    response_mime_type="text/plain",
+)
+safety_settings = types.MappingProxyType({
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+})
+
+# Istanza unica del modello, condivisa da tutte le chiamate (e da tutti i thread)
+MODEL = genai.GenerativeModel(
+    GEMINI_MODEL_NAME,
+    safety_settings=safety_settings,
+    generation_config=generation_config
+)
 
 # --- Prompt Template per Gemini ---
-PROMPT_TEMPLATE = """
-OBIETTIVO: Filtrare il seguente file DAT XML per la console **{console_name}** di **{console_maker}**. Voglio mantenere SOLO i giochi che soddisfano **ALMENO UNO** dei seguenti criteri (con **priorità assoluta** data al Criterio 1):
+# Istruzioni statiche (identiche per ogni file), anteposte alla parte dinamica a ogni chiamata
+PROMPT_INSTRUCTIONS = """
+OBIETTIVO: Filtrare il file DAT XML fornito nella richiesta per la console e il produttore indicati nei PARAMETRI. Voglio mantenere SOLO i giochi che soddisfano **ALMENO UNO** dei seguenti criteri (con **priorità assoluta** data al Criterio 1):
 
 1.  **Raccomandati dalla Community (/v/):** Il gioco (considerando il suo nome base e le sue *varianti di titolo regionali note*) è generalmente considerato una raccomandazione chiave dalla community (es. presente nelle liste `/v/ Recommended Games Wiki` per la console specificata - usa la tua conoscenza interna). **Se un gioco soddisfa questo criterio, DEVE essere incluso, indipendentemente dagli altri criteri.**
-2.  **Acclamati dalla Critica (Ufficiali):** Il gioco è una *release ufficiale* (considerando tutte le sue varianti regionali) con un'alta acclamazione critica storica (punteggio stimato **>= {score_threshold}/100** o universalmente riconosciuto come "must-play" per la piattaforma).
+2.  **Acclamati dalla Critica (Ufficiali):** Il gioco è una *release ufficiale* (considerando tutte le sue varianti regionali) con un'alta acclamazione critica storica (punteggio stimato **>= SOGLIA/100**, con la SOGLIA indicata nei PARAMETRI, o universalmente riconosciuto come "must-play" per la piattaforma).
 3.  **Giochi Non Ufficiali di Qualità:** Il gioco è un *homebrew, hack, traduzione fan, o port non ufficiale* **altamente considerato, ben recensito, o raccomandato** dalla community, rappresentando un'aggiunta di alta qualità.
 
 ISTRUZIONI DETTAGLIATE:
 
-* **Input:** Il file DAT XML fornito di seguito contiene l'header originale e una lista di tag `<game name="...">` che rappresentano TUTTI i giochi disponibili nel DAT originale completo. Il nome console (`{console_name}`) e il produttore (`{console_maker}`) sono stati estratti dall'header.
+* **Input:** Il file DAT XML fornito nella richiesta contiene l'header originale e, dentro l'elemento `<names>`, l'elenco dei nomi di TUTTI i giochi disponibili nel DAT originale completo, uno per riga (testo letterale, senza entità XML). Il nome console e il produttore indicati nei PARAMETRI sono stati estratti dall'header.
 * **Confronto & Selezione:**
-    * Identifica ogni gioco dall'attributo `name`.
+    * Identifica ogni gioco dalla sua riga in `<names>`.
     * **Dai priorità assoluta ai giochi che soddisfano il Criterio 1.** Includili sempre.
     * Per gli altri giochi, considera le **varianti di titolo regionali** (es. Spyro 2 USA vs Europe) come lo stesso gioco concettuale per i criteri 1 e 2.
-    * Se un gioco concettuale (non già incluso tramite Criterio 1) soddisfa il Criterio 2 (con soglia >= {score_threshold}/100) OPPURE il Criterio 3, includi il relativo tag `<game name="...">` (esattamente come fornito nell'input) nella tua risposta.
-* **Output:** Genera un NUOVO file DAT XML contenente **SOLO** l'elemento `<header>` originale (che ti fornisco) e di seguito **SOLO i tag `<game name="...">`** dei giochi selezionati. NON includere nessun altro dato dentro i tag `<game>`. L'output deve essere XML valido e ben formato. Assicurati che i caratteri speciali nell'attributo `name` siano correttamente escapati (`&amp;`, `&lt;`, `&gt;`, `&quot;`, `&apos;`).
-* **IMPORTANTE:** Rispondi SOLO con il contenuto XML, senza introduzioni, spiegazioni o marker ```xml ```. Inizia direttamente con `<?xml version='1.0' encoding='utf-8'?>` o `<datafile>`.
+    * Se un gioco concettuale (non già incluso tramite Criterio 1) soddisfa il Criterio 2 (con punteggio >= SOGLIA/100) OPPURE il Criterio 3, includi il relativo nome (esattamente come fornito nell'input) nella tua risposta.
+* **Output:** Restituisci **SOLO** l'elenco dei nomi dei giochi selezionati, uno per riga, copiati carattere per carattere dall'input (senza escape o entità XML). NON includere l'header, tag XML, numerazione o elenchi puntati.
+* **IMPORTANTE:** Rispondi SOLO con l'elenco dei nomi, senza introduzioni, spiegazioni o marker ```. Inizia direttamente con il primo nome.
+"""
+
+# Parte dinamica del prompt (per file)
+PROMPT_REQUEST_TEMPLATE = """
+PARAMETRI:
+* Console: **{console_name}**
+* Produttore: **{console_maker}**
+* SOGLIA punteggio critica: **{score_threshold}**
 
 FILE DAT "COMPRESSO" DA FILTRARE:
 
@@ -122,17 +205,39 @@ FILE DAT "COMPRESSO" DA FILTRARE:
 {compressed_dat_content}
 ```
 """
+PROMPT_TEMPLATE = PROMPT_INSTRUCTIONS + PROMPT_REQUEST_TEMPLATE
+# Versione del prompt (derivata dal testo completo): invalida la cache quando il template cambia
+PROMPT_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode('utf-8')).hexdigest()[:12]
+
+# --- Cache risposte API ---
+# Directory della cache su disco delle risposte Gemini (None = cache disabilitata)
+DEFAULT_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "gemini-aknf"
+response_cache_dir = DEFAULT_CACHE_DIR
+
+# Riformatta l'intero DAT finale con lxml (richiede un secondo parsing completo, opzione --pretty)
+pretty_print_output = False
 
 # --- Funzioni Helper ---
 
+# Espressioni regolari compilate una sola volta al caricamento del modulo
+_RE_PAREN = re.compile(r'\s*\([^)]*?\)\s*')
+_RE_WS = re.compile(r'\s{2,}')
+_RE_FN_WS = re.compile(r'\s+')
+
+# Tabella per str.translate: separatori di percorso -> '-', caratteri non validi e di controllo rimossi
+_FN_TRANSLATE = {ord('/'): '-', ord('\\'): '-'}
+_FN_TRANSLATE.update(dict.fromkeys(map(ord, '<>:"|?*')))
+_FN_TRANSLATE.update(dict.fromkeys(range(0x20)))
+_FN_TRANSLATE[0x7f] = None
+
 def extract_console_details(raw_name):
     """Pulisce il nome grezzo, rimuove parentesi e divide in produttore e nome console."""
     if raw_name is None:
         return "Sconosciuto", "Nome Console Sconosciuto"
     original_name_for_debug = raw_name
     try:
-        cleaned_name = re.sub(r'\s*\([^)]*?\)\s*', ' ', raw_name).strip()
-        cleaned_name = re.sub(r'\s{2,}', ' ', cleaned_name).strip()
+        cleaned_name = _RE_PAREN.sub(' ', raw_name).strip()
+        cleaned_name = _RE_WS.sub(' ', cleaned_name).strip()
         parts = cleaned_name.split(' - ', 1)
         if len(parts) == 2:
             maker = parts[0].strip()
@@ -150,218 +255,510 @@ def extract_console_details(raw_name):
             console.print(f"Avviso: Errore estrazione dettagli console da '{original_name_for_debug}': {e}. Uso fallback.")
         return "Sconosciuto", original_name_for_debug
 
-def escape_xml_attribute(value):
-    """Escape special characters for XML attributes using html library."""
-    if value is None: return ""
-    return html.escape(value, quote=True)
+# Parser lxml condiviso per i frammenti XML (header, riformattazione finale): scarta i nodi di solo spazio,
+# non mantiene la tabella degli id, accetta nodi di testo enormi e non espande entità esterne.
+# lxml serializza internamente l'uso dello stesso parser da più thread.
+if LXML_AVAILABLE:
+    _LXML_PARSER = ET.XMLParser(encoding='utf-8', recover=True, remove_blank_text=True, huge_tree=True,
+                                collect_ids=False, resolve_entities=False)
+else:
+    _LXML_PARSER = None
+
+def _xml_parser():
+    """Ritorna il parser lxml condiviso, oppure un nuovo parser ET standard (che non è riutilizzabile dopo close())."""
+    return _LXML_PARSER if LXML_AVAILABLE else ET.XMLParser(encoding='utf-8')
+
+# Tag di apertura <game ...> (attributi quotati, che possono contenere '>') e attributo name.
+# Commenti e CDATA vengono riconosciuti per poterli saltare.
+_RE_GAME_START_TAG = re.compile(rb"""<!--.*?-->|<!\[CDATA\[.*?\]\]>|<game\b(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*(/?)>""", re.S)
+_RE_NAME_ATTR = re.compile(rb"""\sname\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_RE_XML_ENTITY = re.compile(r'&(#[xX][0-9a-fA-F]+|#[0-9]+|amp|lt|gt|quot|apos);')
+_XML_NAMED_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+def _replace_xml_entity(match):
+    entity = match.group(1)
+    if entity[0] == '#':
+        return chr(int(entity[2:], 16) if entity[1] in 'xX' else int(entity[1:]))
+    return _XML_NAMED_ENTITIES[entity]
+
+# Encoding dichiarato nel prologo XML (<?xml ... encoding="..."?>)
+_RE_XML_DECL_ENCODING = re.compile(rb"""\s*<\?xml[^>]*?\sencoding\s*=\s*["']([A-Za-z][A-Za-z0-9._-]*)["']""")
+
+def detect_dat_encoding(head):
+    """Ritorna il nome (normalizzato) dell'encoding del documento dai primi byte del DAT: BOM, poi dichiarazione XML, default UTF-8.
+    None se l'encoding è sconosciuto."""
+    if head.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return 'utf-32'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if head.startswith(codecs.BOM_UTF8):
+        head = head[len(codecs.BOM_UTF8):]
+    match = _RE_XML_DECL_ENCODING.match(head)
+    try:
+        return codecs.lookup(match.group(1).decode('ascii') if match else 'utf-8').name
+    except LookupError:
+        return None
+
+def index_dat_games(filepath):
+    """Scansiona il DAT (via mmap) e ritorna ({nome gioco: (byte_inizio, byte_fine)} dell'elemento <game> originale, encoding).
+    Con encoding sconosciuti o non compatibili con ASCII (UTF-16/32) l'indice resta vuoto."""
+    offsets = {}
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return offsets, 'utf-8'
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            encoding = detect_dat_encoding(mm[:256])
+            if encoding is None or '<game name=""'.encode(encoding) != b'<game name=""':
+                return offsets, encoding
+            pos = 0
+            while True:
+                match = _RE_GAME_START_TAG.search(mm, pos)
+                if match is None:
+                    break
+                start, end = match.start(), match.end()
+                if mm[start + 1] == 0x21: # '<!': commento o CDATA, da saltare
+                    pos = end
+                    continue
+                if not match.group(1): # Non auto-chiuso: l'elemento termina con </game>
+                    close_pos = mm.find(b'</game>', end)
+                    if close_pos == -1:
+                        break
+                    end = close_pos + len(b'</game>')
+                name_match = _RE_NAME_ATTR.search(mm, start, match.end())
+                if name_match:
+                    raw_name = name_match.group(1) if name_match.group(1) is not None else name_match.group(2)
+                    game_name = _RE_XML_ENTITY.sub(_replace_xml_entity, raw_name.decode(encoding, 'replace'))
+                    offsets[game_name] = (start, end)
+                pos = end
+    return offsets, encoding
+
+class DatGameIndex:
+    """Accesso lazy all'XML originale dei giochi (bytes UTF-8): materializza solo i giochi richiesti leggendo il DAT via mmap.
+    I DAT con encoding diverso da UTF-8 vengono ricodificati in UTF-8 gioco per gioco."""
+    def __init__(self, filepath, offsets, encoding='utf-8'):
+        self.filepath = filepath
+        self.offsets = offsets
+        self.encoding = encoding
+        self.extra = {} # XML serializzato (bytes) per i giochi non localizzati dalla scansione degli offset
+        self._file = None
+        self._mm = None
+
+    def __contains__(self, name):
+        return name in self.extra or name in self.offsets
+
+    def get(self, name, default=None):
+        game_xml = self.extra.get(name)
+        if game_xml is not None:
+            return game_xml
+        span = self.offsets.get(name)
+        if span is None:
+            return default
+        if self._mm is None:
+            self._file = open(self.filepath, 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        game_xml = self._mm[span[0]:span[1]]
+        if self.encoding not in ('utf-8', 'ascii'):
+            game_xml = game_xml.decode(self.encoding).encode('utf-8')
+        return game_xml
+
+    def __getstate__(self):
+        # Passabile tra processi (pool di parsing): la mappatura del file non viene serializzata
+        state = self.__dict__.copy()
+        state['_file'] = state['_mm'] = None
+        return state
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
 
 def parse_and_compress_dat(filepath):
-    """Legge DAT, estrae header, nomi giochi, dati originali e conteggio."""
-    original_games_data = {}
-    compressed_game_tags = []
+    """Legge DAT in streaming (singolo passaggio), estrae header, nomi giochi, indice dei dati originali e conteggio."""
+    original_games_data = None
+    compressed_games_buf = io.BytesIO() # Nomi dei giochi per l'IA (uno per riga), scritti direttamente in bytes
     console_maker = "Sconosciuto"
     console_name = "Nome Console Sconosciuto"
-    original_header_xml = "<header><name>Header Mancante</name><description>Header originale non trovato o illeggibile.</description></header>"
+    original_header_xml = b"<header><name>Header Mancante</name><description>Header originale non trovato o illeggibile.</description></header>"
     game_count_original = 0
-    root = None
+    header_found = False
     console_name_raw = "[Nome non estratto]"
+    # Con più file in parallelo i messaggi si alternano: ognuno riporta il file a cui si riferisce
+    tag = f"[cyan]{filepath.name}[/cyan]:"
 
     console.print(f"   Parsing file DAT: [cyan]{filepath.name}[/cyan]")
     try:
-        # Usa lxml per il parsing se disponibile, altrimenti fallback a ET standard
-        # recover=True tenta di recuperare da errori XML (solo lxml)
-        parser_engine = ET.XMLParser(encoding='utf-8', recover=(LXML_AVAILABLE))
         try:
-            # Parsing completo per estrarre header e giochi
-            tree = ET.parse(filepath, parser=parser_engine)
-            root = tree.getroot()
-
-            # Estrazione header
-            header_element = root.find('header')
-            if header_element is not None:
-                # Ricostruisce l'XML dell'header originale (senza pretty print qui)
-                original_header_xml = ET.tostring(header_element, encoding='unicode', method='xml')
-                name_elem = header_element.find('name')
-                if name_elem is not None and name_elem.text is not None:
-                    console_name_raw = name_elem.text
-                    console_maker, console_name = extract_console_details(console_name_raw)
+            # Indicizza gli offset dei giochi: l'XML originale sarà letto solo per i giochi mantenuti
+            original_games_data = DatGameIndex(filepath, *index_dat_games(filepath))
+            with open(filepath, 'rb') as f:
+                # Un solo passaggio iterparse: header e giochi vengono estratti man mano,
+                # senza costruire l'intero albero in memoria.
+                # recover=True tenta di recuperare da errori XML, huge_tree per DAT molto grandi (solo lxml)
+                if LXML_AVAILABLE:
+                    context = ET.iterparse(f, events=('end',), tag=('header', 'game'), huge_tree=True, recover=True,
+                                           collect_ids=False, resolve_entities=False)
                 else:
-                    console.print("[yellow]Avviso:[/yellow] Tag <name> non trovato o vuoto nell'header.")
-                    console_name_raw = "[Tag <name> mancante/vuoto]"
-            else:
-                console.print("[red]Errore:[/red] Tag <header> non trovato nel file DAT.")
+                    context = ET.iterparse(f, events=('end',)) # 'tag' non supportato da ET standard, filtro nel loop
+
+                for event, elem in context:
+                    if elem.tag == 'header' and not header_found:
+                        header_found = True
+                        # Ricostruisce l'XML dell'header originale in bytes UTF-8 (senza pretty print qui)
+                        original_header_xml = ET.tostring(elem, encoding='utf-8', method='xml')
+                        name_elem = elem.find('name')
+                        if name_elem is not None and name_elem.text is not None:
+                            console_name_raw = name_elem.text
+                            console_maker, console_name = extract_console_details(console_name_raw)
+                        else:
+                            console.print(f"{tag} [yellow]Avviso:[/yellow] Tag <name> non trovato o vuoto nell'header.")
+                            console_name_raw = "[Tag <name> mancante/vuoto]"
+                    elif elem.tag == 'game':
+                        game_count_original += 1
+                        game_name = elem.get('name')
+                        if game_name:
+                            # Serializza l'XML originale solo se la scansione degli offset non lo ha trovato
+                            if game_name not in original_games_data.offsets:
+                                original_games_data.extra[game_name] = ET.tostring(elem, encoding='utf-8', method='xml').strip()
+                            # Solo il nome, come testo letterale: l'IA lo restituisce identico
+                            compressed_games_buf.write(game_name.encode('utf-8'))
+                            compressed_games_buf.write(b'\n')
+                    else:
+                        continue
+
+                    # Libera la memoria degli elementi già elaborati
+                    elem.clear()
+                    if LXML_AVAILABLE:
+                        while elem.getprevious() is not None:
+                            del elem.getparent()[0]
 
         except ET.ParseError as e_parse: # Errore di parsing XML
-            console.print(f"   [red]Errore FATALE:[/red] Parsing XML fallito: {e_parse}")
+            console.print(f"   {tag} [red]Errore FATALE:[/red] Parsing XML fallito: {e_parse}")
             line, col = getattr(e_parse, 'position', ('N/A', 'N/A'))
-            console.print(f"   -> Errore vicino a riga: {line}, colonna: {col}")
+            console.print(f"   {tag} -> Errore vicino a riga: {line}, colonna: {col}")
             return "Sconosciuto", "Errore Parsing XML", None, None, None, 0
         except Exception as e_generic_parse: # Altri errori durante il parsing
-             console.print(f"   [red]Errore FATALE:[/red] Errore durante il parsing: {e_generic_parse}")
+             console.print(f"   {tag} [red]Errore FATALE:[/red] Errore durante il parsing: {e_generic_parse}")
              return "Sconosciuto", "Errore Parsing Generico", None, None, None, 0
 
+        if not header_found:
+            console.print(f"{tag} [red]Errore:[/red] Tag <header> non trovato nel file DAT.")
+
         # Gestione fallback nome console se ancora sconosciuto
         if console_name == "Nome Console Sconosciuto" and console_maker == "Sconosciuto":
              fallback_name_raw = Path(filepath).stem
-             console.print(f"[yellow]Avviso:[/yellow] Dettagli console non ricavati ('{console_name_raw}'). Uso nome file: '{fallback_name_raw}'")
+             console.print(f"{tag} [yellow]Avviso:[/yellow] Dettagli console non ricavati ('{console_name_raw}'). Uso nome file: '{fallback_name_raw}'")
              console_maker, console_name = extract_console_details(fallback_name_raw)
 
-        console.print(f"   -> Produttore per IA: [bold yellow]{console_maker}[/bold yellow]")
-        console.print(f"   -> Nome Console per IA: [bold magenta]{console_name}[/bold magenta]")
-
-        # Estrazione giochi
-        game_elements = root.findall('.//game')
-        game_count_original = len(game_elements)
-        console.print(f"   -> Trovati [bold cyan]{game_count_original}[/bold cyan] giochi nel DAT originale.")
-
-        for game_elem in game_elements:
-            game_name = game_elem.get('name')
-            if game_name:
-                # Salva l'XML originale del gioco
-                game_xml_str = ET.tostring(game_elem, encoding='unicode', method='xml')
-                original_games_data[game_name] = game_xml_str
-                # Crea il tag compresso per l'IA
-                compressed_game_tags.append(f'<game name="{escape_xml_attribute(game_name)}"/>')
-
-        # Costruisci il contenuto XML compresso per l'IA
-        header_str = original_header_xml.strip()
-        compressed_dat_content = f"<?xml version='1.0' encoding='utf-8'?>\n<datafile>\n{header_str}\n"
-        compressed_dat_content += "\n".join(compressed_game_tags)
-        compressed_dat_content += "\n</datafile>"
+        console.print(f"   {tag} -> Produttore per IA: [bold yellow]{console_maker}[/bold yellow]")
+        console.print(f"   {tag} -> Nome Console per IA: [bold magenta]{console_name}[/bold magenta]")
+        console.print(f"   {tag} -> Trovati [bold cyan]{game_count_original}[/bold cyan] giochi nel DAT originale.")
+
+        # Costruisci il contenuto compresso per l'IA: header XML + elenco dei nomi (decodifica in stringa una sola volta)
+        buf = io.BytesIO()
+        buf.write(b"<?xml version='1.0' encoding='utf-8'?>\n<datafile>\n")
+        buf.write(original_header_xml.strip())
+        buf.write(b"\n<names>\n")
+        buf.write(compressed_games_buf.getbuffer())
+        buf.write(b"</names>\n</datafile>")
+        compressed_dat_content = buf.getvalue().decode('utf-8') # L'SDK Gemini richiede testo
 
         return console_maker, console_name, original_header_xml, original_games_data, compressed_dat_content, game_count_original
 
     except Exception as e:
-        console.print(f"[red]Errore inaspettato durante parsing/compressione:[/red] {e}")
+        console.print(f"{tag} [red]Errore inaspettato durante parsing/compressione:[/red] {e}")
         import traceback
-        traceback.print_exc()
+        console.print(traceback.format_exc(), markup=False, highlight=False)
         return "Sconosciuto", "Errore Inaspettato", None, None, None, 0
 
-# Classe per gestire l'animazione di attesa (spinner)
-class ProcessingIndicator:
-    def __init__(self, message="   Chiamata API Gemini... "):
-        self._message = message
-        self._thread = None
-        self._stop_event = threading.Event()
-        self._spinner = itertools.cycle(['|', '/', '-', '\\'])
+class _RecordingConsole:
+    """Console dei processi di parsing: registra le stampe, riprodotte poi dal processo principale
+    (che gestisce lo spinner di Progress)."""
+    def __init__(self):
+        self.calls = []
+
+    def print(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+
+def _parse_and_compress_dat_in_worker(filepath):
+    """Esegue parse_and_compress_dat in un processo del pool; ritorna (risultato, stampe registrate)."""
+    global console
+    worker_console, console = console, _RecordingConsole()
+    try:
+        return parse_and_compress_dat(filepath), console.calls
+    finally:
+        console = worker_console
+
+# Limitatore di richieste condiviso tra i thread (finestra scorrevole di 60s)
+class RateLimiter:
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self._calls = collections.deque()
         self._lock = threading.Lock()
 
-    def _animate(self):
-        while not self._stop_event.is_set():
-            with self._lock:
-                if not self._stop_event.is_set():
-                    sys.stdout.write(f"\r{self._message}{next(self._spinner)}")
-                    sys.stdout.flush()
-            time.sleep(0.15)
-        sys.stdout.write('\r' + ' ' * (len(self._message) + 5) + '\r')
-        sys.stdout.flush()
-
-    def start(self):
-        sys.stdout.write(f"\r{self._message}...")
-        sys.stdout.flush()
-        self._stop_event.clear()
-        self._thread = threading.Thread(target=self._animate, daemon=True)
-        self._thread.start()
-
-    def stop(self):
-        if self._thread and self._thread.is_alive():
+    def acquire(self):
+        """Blocca finché non è possibile effettuare una nuova chiamata rispettando il limite rpm."""
+        if not self.rpm or self.rpm <= 0:
+            return
+        while True:
             with self._lock:
-                self._stop_event.set()
-            self._thread.join()
-
-def call_gemini_api(prompt_text):
-    """Invia il prompt all'API Gemini e ritorna la risposta testuale."""
-    indicator = ProcessingIndicator(f"   Chiamata API Gemini ([yellow]{GEMINI_MODEL_NAME}[/yellow])... ")
-    indicator.start()
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= 60:
+                    self._calls.popleft()
+                if len(self._calls) < self.rpm:
+                    self._calls.append(now)
+                    return
+                wait = 60 - (now - self._calls[0])
+            time.sleep(wait)
+
+api_rate_limiter = RateLimiter(GEMINI_RPM_LIMIT)
+
+class AIResponseError(Exception):
+    """Risposta dell'IA assente, bloccata o non utilizzabile."""
+
+def _stream_gemini_chunks(prompt_text, label):
+    """Invia il prompt all'API Gemini in streaming e genera i frammenti della risposta (bytes UTF-8) man mano che arrivano."""
+    task_id = progress.add_task(f"   Chiamata API Gemini ([yellow]{GEMINI_MODEL_NAME}[/yellow]) - [cyan]{label}[/cyan]...")
     response = None
-    error_message = None
+    received = False
     try:
-        model = genai.GenerativeModel(
-            GEMINI_MODEL_NAME,
-            safety_settings=safety_settings,
-            generation_config=generation_config
-        )
-        response = model.generate_content(prompt_text, request_options={'timeout': 600})
+        contents = PROMPT_INSTRUCTIONS + prompt_text
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            api_rate_limiter.acquire()
+            try:
+                response = MODEL.generate_content(contents, stream=True, request_options={'timeout': 600})
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError: # Chunk senza testo (es. richiesta bloccata), motivo riportato sotto
+                        text = ""
+                    if text:
+                        if not received:
+                            progress.remove_task(task_id)
+                            task_id = None
+                            console.print(f"   [green]Risposta API in arrivo[/green] - [cyan]{label}[/cyan]...")
+                            received = True
+                        yield text.encode('utf-8')
+                break
+            except google_exceptions.ResourceExhausted:
+                # Quota superata: si ritenta solo se non è ancora arrivato nessun chunk (niente risposte duplicate)
+                if received or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                delay = min(60, 2 ** attempt + random.random())
+                console.print(f"   [yellow]Avviso:[/yellow] Quota API superata (429) - [cyan]{label}[/cyan]. Nuovo tentativo tra {delay:.1f}s...")
+                time.sleep(delay)
     except Exception as e:
-        error_message = f"Errore durante la chiamata API Gemini: {e}"
+        raise AIResponseError(f"Errore durante la chiamata API Gemini: {e}") from e
     finally:
-        indicator.stop()
+        if task_id is not None:
+            progress.remove_task(task_id)
 
-    if error_message:
-        console.print(f"\n   [red]Fallita:[/red] {error_message}")
-        return None
-
-    if not hasattr(response, 'text') or not response.text:
+    if not received:
         reason = "Nessuna risposta testuale ricevuta."
-        if hasattr(response, 'prompt_feedback') and response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
-            reason = f"Richiesta bloccata per: {response.prompt_feedback.block_reason}"
-        console.print(f"\n   [red]Fallita:[/red] {reason}")
-        if hasattr(response, 'prompt_feedback') and hasattr(response.prompt_feedback,'safety_ratings') and response.prompt_feedback.safety_ratings:
+        prompt_feedback = getattr(response, 'prompt_feedback', None)
+        if prompt_feedback and getattr(prompt_feedback, 'block_reason', None):
+            reason = f"Richiesta bloccata per: {prompt_feedback.block_reason}"
+        if prompt_feedback and getattr(prompt_feedback, 'safety_ratings', None):
              console.print("     Safety Ratings:", style="dim")
-             for rating in response.prompt_feedback.safety_ratings:
+             for rating in prompt_feedback.safety_ratings:
                   console.print(f"        - {rating.category}: {rating.probability}", style="dim")
+        raise AIResponseError(reason)
+
+def call_gemini_api(prompt_text, label=""):
+    """Invia la parte dinamica del prompt all'API Gemini (le istruzioni statiche sono anteposte).
+    Ritorna un generatore dei chunk della risposta in bytes UTF-8, ricevuti in streaming.
+    Gli errori (API, richiesta bloccata) sono sollevati come AIResponseError durante l'iterazione;
+    la validazione del formato è fatta da iter_ai_game_names."""
+    return _stream_gemini_chunks(prompt_text, label)
+
+def debug_dump_filename(label, suffix):
+    """Nome del file di debug per il DAT label, es. "Nintendo - Game Boy_failed_ai_response_games.xml"
+    (un file per DAT: i worker paralleli non si sovrascrivono a vicenda)."""
+    return sanitize_filename(f"{Path(label).stem}_{suffix}") if label else suffix
+
+def write_file_atomic(path, data):
+    """Scrive data in path tramite un file temporaneo nella stessa directory e os.replace:
+    il file finale è sempre completo, anche se più thread scrivono lo stesso percorso."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    created = False
+    try:
+        with open(tmp_path, 'xb') as f_tmp:
+            created = True
+            f_tmp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if created:
+            os.unlink(tmp_path)
+        raise
+
+def _report_invalid_response(response_head, reason, label=""):
+    """Mostra e salva l'inizio (bytes) di una risposta non valida, poi solleva AIResponseError."""
+    dump_filename = debug_dump_filename(label, "invalid_ai_response_start.xml")
+    console.print(f"   [red]ERRORE:[/red] La risposta dell'IA non è nel formato atteso ({reason}). Inizio:")
+    console.print(f"[dim]{response_head[:500].decode('utf-8', 'replace')}...[/dim]")
+    try:
+        with open(dump_filename, "wb") as f_inv:
+            f_inv.write(response_head)
+        console.print(f"   (Risposta problematica salvata in [filename]{dump_filename}[/filename])", style="yellow")
+    except Exception as write_err:
+        console.print(f"   [yellow]Avviso:[/yellow] Impossibile salvare {dump_filename}: {write_err}")
+    raise AIResponseError(f"La risposta dell'IA non è nel formato atteso: {reason}")
+
+def iter_ai_game_names(chunks, label=""):
+    """Divide in righe i chunk (bytes) della risposta e genera i nomi dei giochi man mano che arrivano.
+    Righe vuote e marker markdown (```) sono ignorati. Una risposta vuota o in XML (invece dell'elenco
+    di nomi) solleva AIResponseError appena ricevuta la prima riga utile."""
+    head_parts = []
+    validated = False
+    pending = b""
+
+    def names_from(lines):
+        nonlocal validated
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(b"```"):
+                continue
+            if not validated:
+                if line.startswith(b"<"):
+                    _report_invalid_response(b"".join(head_parts), "XML invece dell'elenco di nomi", label)
+                validated = True
+                head_parts.clear()
+            yield line.decode('utf-8', 'replace')
+
+    for data in chunks:
+        if not validated:
+            head_parts.append(data)
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop() # Riga incompleta: attende il chunk successivo
+        yield from names_from(lines)
+    yield from names_from((pending,))
+    if not validated:
+        _report_invalid_response(b"".join(head_parts), "risposta vuota", label)
+
+def get_response_cache_key(prompt_text):
+    """Chiave cache: SHA-256 di modello, versione prompt e prompt completo (DAT compresso, console, soglia)."""
+    hasher = hashlib.sha256()
+    for part in (GEMINI_MODEL_NAME, PROMPT_VERSION, prompt_text):
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+def load_cached_response(prompt_text):
+    """Ritorna la risposta in cache (bytes) per il prompt, oppure None se assente/illeggibile o cache disabilitata."""
+    if response_cache_dir is None:
         return None
-
-    console.print("\n   [green]Risposta API ricevuta.[/green]")
-    text_response = response.text.strip()
-
-    text_response = re.sub(r"^```xml\s*", "", text_response, flags=re.IGNORECASE)
-    text_response = re.sub(r"^```\s*", "", text_response)
-    text_response = re.sub(r"\s*```$", "", text_response)
-    text_response = text_response.strip()
-
-    if not text_response.startswith(("<?xml", "<datafile>")):
-        console.print(f"   [red]ERRORE:[/red] La risposta dell'IA non sembra XML valido. Inizio:")
-        console.print(f"[dim]{text_response[:500]}...[/dim]")
-        try:
-            with open("invalid_ai_response_start.xml", "w", encoding="utf-8") as f_inv:
-                f_inv.write(text_response)
-            console.print("   (Risposta problematica salvata in [filename]invalid_ai_response_start.xml[/filename])", style="yellow")
-        except Exception as write_err:
-            console.print(f"   [yellow]Avviso:[/yellow] Impossibile salvare invalid_ai_response_start.xml: {write_err}")
+    cache_path = response_cache_dir / f"{get_response_cache_key(prompt_text)}.txt.gz"
+    if not cache_path.exists():
         return None
-
-    return text_response
-
-def reconstruct_filtered_dat(ai_response_xml, original_header_xml, original_games_data):
-    """Ricostruisce il DAT completo usando la risposta filtrata dell'IA e modifica l'header."""
-    console.print("   Ricostruzione DAT filtrato...")
-    kept_game_names = []
-    ai_root = None
-    root_tag_name = "datafile"
-
-    if not ai_response_xml:
-        console.print("   [red]ERRORE:[/red] Nessuna risposta XML dall'IA per ricostruire.")
+    try:
+        return gzip.decompress(cache_path.read_bytes())
+    except Exception as e:
+        console.print(f"   [yellow]Avviso:[/yellow] Cache non leggibile ({cache_path.name}): {e}. Ignorata.")
         return None
 
+def save_cached_response(prompt_text, response_data):
+    """Salva la risposta in cache (scrittura atomica tmp + os.replace) con un sidecar JSON di metadati."""
+    if response_cache_dir is None:
+        return
+    key = get_response_cache_key(prompt_text)
+    try:
+        response_cache_dir.mkdir(parents=True, exist_ok=True)
+        for suffix, payload in ((".txt.gz", gzip.compress(response_data, compresslevel=6)),
+                                (".json", json.dumps({"model": GEMINI_MODEL_NAME,
+                                                      "prompt_version": PROMPT_VERSION,
+                                                      "script_version": SCRIPT_VERSION,
+                                                      "timestamp": time.time()}).encode('utf-8'))):
+            fd, tmp_path = tempfile.mkstemp(dir=response_cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f_tmp:
+                    f_tmp.write(payload)
+                os.replace(tmp_path, response_cache_dir / f"{key}{suffix}")
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+    except Exception as e:
+        console.print(f"   [yellow]Avviso:[/yellow] Impossibile salvare la risposta in cache: {e}")
+
+# Database SQLite (nella directory della cache) che associa i DAT di input già elaborati al DAT filtrato prodotto
+RESULT_CACHE_DB_NAME = "results.sqlite3"
+
+def get_result_cache_key(filepath, score_threshold):
+    """Chiave cache risultati: SHA-256 del contenuto del DAT di input, soglia, formato di output (--pretty), modello e versioni di script e prompt."""
+    hasher = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    for part in (str(score_threshold), "pretty" if pretty_print_output else "raw", GEMINI_MODEL_NAME, SCRIPT_VERSION, PROMPT_VERSION):
+        hasher.update(b'\0')
+        hasher.update(part.encode('utf-8'))
+    return hasher.hexdigest()
+
+def _open_result_cache_db():
+    """Apre (creandolo se serve) il database dei risultati; una connessione per operazione, usabile da ogni thread."""
+    response_cache_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(response_cache_dir / RESULT_CACHE_DB_NAME, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                 "key TEXT PRIMARY KEY, output_name TEXT NOT NULL, game_count INTEGER NOT NULL, timestamp REAL NOT NULL)")
+    return conn
+
+def load_cached_result(filepath, score_threshold):
+    """Cerca il DAT filtrato già prodotto per lo stesso input. Ritorna la tupla (chiave, risultato), con risultato
+    (nome file di output, giochi inclusi, percorso del DAT filtrato in cache) oppure None.
+    La chiave (hash dell'intero DAT) è calcolata solo se il database esiste; una cache non utilizzabile produce solo un avviso."""
+    if response_cache_dir is None:
+        return None, None
+    try:
+        if not (response_cache_dir / RESULT_CACHE_DB_NAME).is_file():
+            return None, None
+        result_key = get_result_cache_key(filepath, score_threshold)
+        with contextlib.closing(_open_result_cache_db()) as conn:
+            row = conn.execute("SELECT output_name, game_count FROM results WHERE key = ?", (result_key,)).fetchone()
+    except Exception as e:
+        console.print(f"   [yellow]Avviso:[/yellow] Cache dei risultati non leggibile: {e}. Ignorata.")
+        return None, None
+    cached_path = response_cache_dir / f"{result_key}.dat"
+    if row is None or not cached_path.is_file():
+        return result_key, None
+    return result_key, (row[0], row[1], cached_path)
+
+def save_cached_result(result_key, filepath, score_threshold, dat_content, output_name, game_count):
+    """Salva in cache il DAT filtrato dal buffer in memoria (scrittura atomica tmp + os.replace) e registra la chiave nel database.
+    Non rilegge il file di output: un altro worker potrebbe averlo già sovrascritto.
+    result_key può essere None (non ancora calcolata dalla ricerca)."""
+    if response_cache_dir is None:
+        return
     try:
-        # Usa lxml per parsare la risposta dell'IA se disponibile
-        parser_engine_ai = ET.XMLParser(encoding='utf-8', recover=(LXML_AVAILABLE))
-        ai_response_clean = re.sub(r"^\s*<\?xml.*?\?>", "", ai_response_xml).strip()
-        # Assicurati che l'input sia bytes per lxml
-        ai_root = ET.fromstring(ai_response_clean.encode('utf-8'), parser=parser_engine_ai)
-        root_tag_name = ai_root.tag
-
-        for game_elem in ai_root.findall('.//game'):
-            game_name = game_elem.get('name')
-            if game_name:
-                kept_game_names.append(game_name)
+        if result_key is None:
+            result_key = get_result_cache_key(filepath, score_threshold)
+        response_cache_dir.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(response_cache_dir / f"{result_key}.dat", dat_content)
+        with contextlib.closing(_open_result_cache_db()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                         (result_key, output_name, game_count, time.time()))
+    except Exception as e:
+        console.print(f"   [yellow]Avviso:[/yellow] Impossibile salvare il risultato in cache: {e}")
+
+def reconstruct_filtered_dat(ai_game_names, original_header_xml, original_games_data, label=""):
+    """Ricostruisce il DAT completo dai nomi dei giochi mantenuti dall'IA (iterabile, anche in streaming) e modifica l'header.
+    Ritorna la tupla (xml_finale in bytes UTF-8, giochi_inclusi); xml_finale è None in caso di errore."""
+    tag = f"[cyan]{label}[/cyan]:" if label else ""
+    console.print(f"   {tag} Ricostruzione DAT filtrato...")
+    kept_game_names = {} # dict usato come insieme ordinato: deduplica mantenendo l'ordine dell'IA
+    root_tag_name = "datafile"
 
+    try:
+        # Consuma i nomi man mano che la risposta dell'IA viene ricevuta e parsata
+        for game_name in ai_game_names:
+            kept_game_names[game_name] = None
+    except AIResponseError:
+        raise
     except Exception as e:
-        console.print(f"   [red]ERRORE FATALE:[/red] Impossibile fare il parsing dei giochi dalla risposta XML dell'IA: {e}")
-        console.print(f"   Risposta ricevuta (primi 1000 caratteri):\n[dim]{ai_response_xml[:1000]}[/dim]")
-        try:
-            with open("failed_ai_response_games.xml", "w", encoding="utf-8") as f_fail:
-                f_fail.write(ai_response_xml)
-            console.print("   (Risposta fallita salvata in [filename]failed_ai_response_games.xml[/filename])", style="yellow")
-        except Exception: pass
-        return None
+        console.print(f"   {tag} [red]ERRORE FATALE:[/red] Impossibile leggere i giochi dalla risposta dell'IA: {e}")
+        return None, 0
 
     try:
         # Parsa l'header originale per modificarlo (usa lxml se disponibile)
-        parser_engine_header = ET.XMLParser(encoding='utf-8', recover=(LXML_AVAILABLE))
-        # Assicurati che l'input sia bytes per lxml
-        header_element = ET.fromstring(original_header_xml.encode('utf-8'), parser=parser_engine_header)
+        header_element = ET.fromstring(original_header_xml, parser=_xml_parser())
 
         # Modifica/Aggiungi description
         desc_tag = header_element.find('description')
@@ -382,95 +779,81 @@ def reconstruct_filtered_dat(ai_response_xml, original_header_xml, original_game
         aknf_tag = ET.Element('geminiaknf')
         aknf_tag.text = f"Created by Gemini AKNF ver. {SCRIPT_VERSION}"
 
-        # Trova l'indice dove inserire il nuovo tag (idealmente dopo <retool>)
-        insert_index = -1
-        retool_tag = header_element.find('retool')
-        if retool_tag is not None:
-            try:
-                children = list(header_element)
-                insert_index = children.index(retool_tag) + 1
-            except ValueError:
-                insert_index = len(header_element)
-        else:
-             clrmamepro_tag = header_element.find('clrmamepro')
-             if clrmamepro_tag is not None:
-                 try:
-                     children = list(header_element)
-                     insert_index = children.index(clrmamepro_tag)
-                 except ValueError:
-                     insert_index = len(header_element)
-             else:
-                 insert_index = len(header_element)
-
-        header_element.insert(insert_index, aknf_tag)
-
-        # Ottieni l'XML dell'header modificato come stringa unicode
-        # Usa pretty_print=True con lxml per indentazione automatica
-        if LXML_AVAILABLE:
-            modified_header_xml = ET.tostring(header_element, encoding='unicode', pretty_print=True, xml_declaration=False)
+        # Inserisce il nuovo tag dopo <retool>, altrimenti prima di <clrmamepro>, altrimenti in fondo
+        # (lxml: addnext/addprevious, senza cercare l'indice tra i figli).
+        after_tag = header_element.find('retool')
+        before_tag = header_element.find('clrmamepro') if after_tag is None else None
+
+        if after_tag is not None:
+            if LXML_AVAILABLE:
+                after_tag.addnext(aknf_tag)
+            else:
+                header_element.insert(list(header_element).index(after_tag) + 1, aknf_tag)
+        elif before_tag is not None:
+            if LXML_AVAILABLE:
+                before_tag.addprevious(aknf_tag)
+            else:
+                header_element.insert(list(header_element).index(before_tag), aknf_tag)
         else:
-            # Fallback senza pretty_print se lxml non è disponibile
-            modified_header_xml = ET.tostring(header_element, encoding='unicode', method='xml')
+            header_element.append(aknf_tag)
+
+        # Reindenta l'header con tab, allineato ai giochi copiati dal DAT (livello 1 sotto <datafile>)
+        ET.indent(header_element, space="\t", level=1)
+        modified_header_xml = ET.tostring(header_element, encoding='utf-8')
 
 
     except Exception as e_header:
-        console.print(f"   [yellow]Avviso:[/yellow] Errore modificando l'header originale: {e_header}. Uso header originale non modificato.")
+        console.print(f"   {tag} [yellow]Avviso:[/yellow] Errore modificando l'header originale: {e_header}. Uso header originale non modificato.")
         modified_header_xml = original_header_xml # Fallback
 
-    final_header_str = modified_header_xml.strip()
+    final_header = modified_header_xml.strip()
 
-    # Costruisci il DAT finale
-    final_dat_parts = []
-    final_dat_parts.append("<?xml version='1.0' encoding='utf-8'?>")
-    final_dat_parts.append(f"<{root_tag_name}>")
-    final_dat_parts.append(final_header_str)
+    # Costruisci il DAT finale direttamente in bytes (i giochi sono copiati così come sono nel DAT originale)
+    out = bytearray()
+    out += b"<?xml version='1.0' encoding='utf-8'?>\n<"
+    out += root_tag_name.encode('utf-8')
+    out += b">\n\t"
+    out += final_header
+    out += b"\n"
 
     found_count = 0
     missing_count = 0
-    unique_kept_names = sorted(list(set(kept_game_names)))
 
-    console.print(f"   -> L'IA ha richiesto [bold cyan]{len(unique_kept_names)}[/bold cyan] giochi unici.")
+    console.print(f"   {tag} -> L'IA ha richiesto [bold cyan]{len(kept_game_names)}[/bold cyan] giochi unici.")
 
-    for name in unique_kept_names:
+    for name in kept_game_names:
         original_game_xml = original_games_data.get(name)
         if original_game_xml:
-            game_data_cleaned = re.sub(r"^\s*<\?xml.*?\?>", "", original_game_xml).strip()
-            # Non aggiungere indentazione manuale qui, lxml dovrebbe averla gestita nell'header
-            # e i giochi dovrebbero mantenere la loro formattazione originale o essere gestiti da un formattatore esterno
-            final_dat_parts.append(game_data_cleaned)
+            # I giochi mantengono la formattazione interna originale: basta indentare il tag di apertura
+            out += b"\t"
+            out += original_game_xml
+            out += b"\n"
             found_count += 1
         else:
-            console.print(f"   [yellow]Avviso:[/yellow] Gioco '{name}' restituito da IA ma non trovato nel DAT originale. Sarà omesso.")
+            console.print(f"   {tag} [yellow]Avviso:[/yellow] Gioco '{name}' restituito da IA ma non trovato nel DAT originale. Sarà omesso.")
             missing_count += 1
 
-    final_dat_parts.append(f"</{root_tag_name}>")
-    console.print(f"   Ricostruzione completata. Giochi [green]inclusi[/green]: [bold cyan]{found_count}[/bold cyan]. Giochi [yellow]mancanti/omessi[/yellow]: {missing_count}.")
+    out += f"</{root_tag_name}>".encode('utf-8')
+    console.print(f"   {tag} Ricostruzione completata. Giochi [green]inclusi[/green]: [bold cyan]{found_count}[/bold cyan]. Giochi [yellow]mancanti/omessi[/yellow]: {missing_count}.")
     if missing_count > 0:
-        console.print("   -> [dim]I giochi mancanti potrebbero indicare preferenze di versione dell'IA o errori nel parsing/matching dei nomi.[/dim]")
+        console.print(f"   {tag} -> [dim]I giochi mancanti potrebbero indicare preferenze di versione dell'IA o errori nel parsing/matching dei nomi.[/dim]")
 
-    # Unisce le parti con newline per creare il file finale
-    # Usa lxml per un pretty print finale dell'intero documento, se disponibile
-    final_xml_string = "\n".join(final_dat_parts)
-    if LXML_AVAILABLE:
+    # Il DAT finale è già indentato.
+    # Con --pretty l'intero documento viene riformattato da lxml (secondo parsing completo).
+    if pretty_print_output and LXML_AVAILABLE:
         try:
-            # Riformatta l'intero documento per coerenza
-            final_root = ET.fromstring(final_xml_string.encode('utf-8'))
-            # Nota: tostring con pretty_print=True aggiunge la dichiarazione XML, quindi non serve aggiungerla manualmente prima
-            return ET.tostring(final_root, encoding='unicode', pretty_print=True, xml_declaration=True)
+            final_root = ET.fromstring(bytes(out), parser=_LXML_PARSER)
+            return ET.tostring(final_root, encoding='utf-8', pretty_print=True, xml_declaration=True), found_count
         except Exception as pretty_print_error:
-            console.print(f"[yellow]Avviso:[/yellow] Errore durante pretty-printing finale con lxml: {pretty_print_error}")
-            # Fallback a stringa non formattata
-            return final_xml_string
-    else:
-        return final_xml_string
+            console.print(f"{tag} [yellow]Avviso:[/yellow] Errore durante pretty-printing finale con lxml: {pretty_print_error}")
+            # Fallback al DAT non riformattato
+    return out, found_count
 
 
 def sanitize_filename(filename):
     """Rimuove o sostituisce caratteri non validi per i nomi file cross-platform."""
-    sanitized = filename.replace('/', '-').replace('\\', '-')
-    sanitized = re.sub(r'[<>:"|?*]', '', sanitized)
-    sanitized = re.sub(r'[\x00-\x1f\x7f]', '', sanitized)
-    sanitized = re.sub(r'\s+', ' ', sanitized).strip()
+    sanitized = filename.translate(_FN_TRANSLATE)
+    sanitized = _RE_FN_WS.sub(' ', sanitized).strip()
     sanitized = sanitized.rstrip('. ')
     MAX_LEN_BYTES = 200
     if len(sanitized.encode('utf-8', 'ignore')) > MAX_LEN_BYTES:
@@ -490,62 +873,58 @@ def sanitize_filename(filename):
     return sanitized
 
 
-# Modificato per accettare score_threshold
-def process_dat_file(filepath, score_threshold):
-    """Orchestra il processo completo per un singolo file DAT."""
-    start_time = time.time()
-    game_count_original = 0
+# DAT di output scritti in questa esecuzione (percorso -> DAT di input): DAT di input diversi
+# possono produrre lo stesso nome (es. No-Intro Parent-Clone e Retool 1G1R della stessa console)
+_claimed_output_paths = {}
+_claimed_output_paths_lock = threading.Lock()
 
-    # Conteggio giochi iniziale (veloce) - Usa lxml iterparse se disponibile
-    try:
-        game_count_original = 0
-        with open(filepath, 'rb') as f:
-             # Usa tag='game' se lxml è disponibile, altrimenti controlla nel loop
-             tag_filter = 'game' if LXML_AVAILABLE else None
-             # Usare 'tag' con iterparse standard genera errore, quindi lo omettiamo se lxml non c'è
-             if LXML_AVAILABLE:
-                 context = ET.iterparse(f, events=('end',), tag=tag_filter)
-             else:
-                 context = ET.iterparse(f, events=('end',)) # Senza tag
-
-             for event, elem in context:
-                 # Se non si usa lxml o tag filter fallisce (improbabile con lxml), controlla qui
-                 if not LXML_AVAILABLE and elem.tag == 'game':
-                     game_count_original += 1
-                 elif LXML_AVAILABLE: # Se lxml e tag filter attivi, conta direttamente
-                     game_count_original += 1
-
-                 # Pulisci l'elemento per liberare memoria
-                 # elem.clear() # Rimosso perché può interferire con lxml, che gestisce meglio la memoria
-                 # Il codice per pulire i parent non è necessario/compatibile
-                 # Tentativo di pulizia più robusto per lxml:
-                 if LXML_AVAILABLE:
-                    elem.clear()
-                    # Elimina riferimenti agli elementi precedenti per liberare memoria
-                    while elem.getprevious() is not None:
-                        del elem.getparent()[0]
-                 else: # Per ET standard
-                    elem.clear()
+def claim_output_path(output_path, filepath):
+    """Registra output_path come prodotto da filepath; avvisa se un altro DAT di questa esecuzione scrive lo stesso file."""
+    with _claimed_output_paths_lock:
+        owner = _claimed_output_paths.setdefault(output_path, filepath)
+    if owner != filepath:
+        console.print(f"   [cyan]{filepath.name}[/cyan]: [yellow]Avviso:[/yellow] Il file di output [green]{output_path.name}[/green] "
+                      f"è prodotto anche da [cyan]{owner.name}[/cyan]: verrà mantenuto l'ultimo scritto.")
 
-    except ET.ParseError as parse_err:
-        console.print(f"[red]Errore parsing XML iniziale per conteggio:[/red] {parse_err} in {filepath.name}")
-    except Exception as e:
-        console.print(f"[red]Errore lettura iniziale per conteggio:[/red] {e} in {filepath.name}")
+# Modificato per accettare score_threshold
+def process_dat_file(filepath, score_threshold, parse_pool=None):
+    """Orchestra il processo completo per un singolo file DAT.
+    Se è fornito parse_pool (ProcessPoolExecutor) il parsing, CPU-bound, viene eseguito in un processo separato."""
+    start_time = time.time()
 
     console.rule(f"Inizio Elaborazione: {filepath.name}", style="blue")
 
-    # Parsa DAT e estrai dettagli console
-    console_maker, console_name, original_header, games_data, compressed_dat, count_from_parse = parse_and_compress_dat(filepath)
+    # Stesso DAT di input (byte per byte), soglia, modello e versione: riusa il DAT filtrato prodotto in precedenza
+    result_key, cached_result = load_cached_result(filepath, score_threshold)
+    if cached_result:
+        output_name, cached_game_count, cached_path = cached_result
+        try:
+            output_path = filepath.parent / output_name
+            claim_output_path(output_path, filepath)
+            write_file_atomic(output_path, cached_path.read_bytes())
+            console.print(Panel(
+                f"File originale: [cyan]{filepath.name}[/cyan] (già elaborato)\n"
+                f"File filtrato: [green]{output_name}[/green] ({cached_game_count} giochi)\n"
+                f"Tempo impiegato: [yellow]{time.time() - start_time:.2f}s[/yellow]",
+                title="[bold green]Risultato Recuperato dalla Cache[/bold green]",
+                border_style="green"
+            ))
+            console.rule(style="green")
+            return True
+        except OSError as e:
+            console.print(f"   [cyan]{filepath.name}[/cyan]: [yellow]Avviso:[/yellow] Impossibile copiare il risultato dalla cache: {e}. Elaboro il file.")
 
-    # Aggiorna conteggio se il primo tentativo è fallito ma il parsing completo ha funzionato
-    if game_count_original == 0 and count_from_parse > 0:
-        game_count_original = count_from_parse
-    # Se anche il secondo conteggio è 0, usa quello iniziale (potrebbe essere 0 ma corretto)
-    elif count_from_parse == 0 and game_count_original > 0:
-         pass # Mantieni game_count_original
-    elif count_from_parse > 0: # Se entrambi > 0, usa quello dal parsing completo (più affidabile)
-        game_count_original = count_from_parse
+    # Parsa DAT e estrai dettagli console
+    if parse_pool is not None:
+        parse_result, parse_messages = parse_pool.submit(_parse_and_compress_dat_in_worker, filepath).result()
+        for args, kwargs in parse_messages:
+            console.print(*args, **kwargs)
+    else:
+        parse_result = parse_and_compress_dat(filepath)
+    console_maker, console_name, original_header, games_data, compressed_dat, count_from_parse = parse_result
 
+    # Il conteggio è un sottoprodotto del parsing in streaming
+    game_count_original = count_from_parse
 
     # Verifica errori critici nel parsing
     if games_data is None or compressed_dat is None:
@@ -555,7 +934,7 @@ def process_dat_file(filepath, score_threshold):
 
     # Prepara il prompt con maker, name e score_threshold
     try:
-        prompt = PROMPT_TEMPLATE.format(
+        prompt = PROMPT_REQUEST_TEMPLATE.format(
             console_maker=console_maker,
             console_name=console_name,
             score_threshold=score_threshold, # Passa la soglia al prompt
@@ -566,38 +945,59 @@ def process_dat_file(filepath, score_threshold):
         console.rule(style="red")
         return False
 
-    # Chiama API Gemini
-    ai_response = call_gemini_api(prompt)
+    # Chiama API Gemini in streaming (o riusa la risposta in cache per lo stesso input)
+    cached_response = load_cached_response(prompt)
+    if cached_response:
+        console.print(f"   [cyan]{filepath.name}[/cyan]: [green]Risposta recuperata dalla cache.[/green]")
+        response_chunks = [cached_response]
+    else:
+        response_chunks = call_gemini_api(prompt, filepath.name)
+
+    # Conserva la risposta ricevuta (bytes) per la cache e per il debug in caso di errore
+    response_parts = []
+    def record_chunks(chunks):
+        for chunk in chunks:
+            response_parts.append(chunk)
+            yield chunk
 
-    if not ai_response:
+    # Ricostruisci DAT finale mentre la risposta arriva (legge dal DAT originale solo i giochi mantenuti)
+    try:
+        final_dat_content, final_game_count = reconstruct_filtered_dat(
+            iter_ai_game_names(record_chunks(response_chunks), filepath.name), original_header, games_data, filepath.name)
+    except AIResponseError as e:
+        console.print(f"\n   [cyan]{filepath.name}[/cyan]: [red]Fallita:[/red] {e}")
         console.print(f"[red]Elaborazione fallita:[/red] Nessuna risposta valida dall'API per {filepath.name}.", style="bold red")
         console.rule(style="red")
         return False
-
-    # Ricostruisci DAT finale
-    final_dat_content = reconstruct_filtered_dat(ai_response, original_header, games_data)
+    finally:
+        games_data.close()
 
     if not final_dat_content:
+        ai_response = b"".join(response_parts)
+        console.print(f"   [cyan]{filepath.name}[/cyan]: Risposta ricevuta (primi 1000 byte):\n[dim]{ai_response[:1000].decode('utf-8', 'replace')}[/dim]")
+        dump_filename = debug_dump_filename(filepath.name, "failed_ai_response_games.xml")
+        try:
+            with open(dump_filename, "wb") as f_fail:
+                f_fail.write(ai_response)
+            console.print(f"   (Risposta fallita salvata in [filename]{dump_filename}[/filename])", style="yellow")
+        except Exception: pass
         console.print(f"[red]Elaborazione fallita:[/red] Errore durante la ricostruzione del DAT per {filepath.name}.", style="bold red")
         console.rule(style="red")
         return False
 
+    if not cached_response:
+        save_cached_response(prompt, b"".join(response_parts))
+
     # Salva file finale - Usando il formato Maker - Name
-    output_filename_base = f"{console_maker} - {console_name} (GeminiAKNF {SCRIPT_VERSION}).dat"
+    output_filename_base = f"{console_maker} - {console_name} {OUTPUT_TAG}.dat"
     safe_output_filename = sanitize_filename(output_filename_base)
     output_path = filepath.parent / safe_output_filename
 
     try:
-        with open(output_path, 'w', encoding='utf-8') as f_out:
-            f_out.write(final_dat_content)
+        claim_output_path(output_path, filepath)
+        write_file_atomic(output_path, memoryview(final_dat_content))
+        save_cached_result(result_key, filepath, score_threshold, memoryview(final_dat_content), output_path.name, final_game_count)
         end_time = time.time()
-        # Riconta i giochi nel file finale per un report più accurato
-        final_game_count = 0
-        try:
-             final_tree = ET.fromstring(final_dat_content.encode('utf-8'))
-             final_game_count = len(final_tree.findall('.//game'))
-        except Exception: # Fallback se il parsing del file finale fallisce
-             final_game_count = final_dat_content.count("<game name=") # Conteggio approssimativo
 
         console.print(Panel(
             f"File originale: [cyan]{filepath.name}[/cyan] ({game_count_original} giochi)\n"
@@ -617,6 +1017,60 @@ def process_dat_file(filepath, score_threshold):
     return False
 
 
+def is_generated_output(filename):
+    """True se il nome file è un DAT già generato dallo script o un file di debug/intermedio."""
+    return GENERATED_MARKER in filename or filename.endswith(EXCLUDED_SUFFIXES)
+
+def run_daemon(score_threshold):
+    """Modalità residente: processa i percorsi .dat letti da stdin (uno per riga) e risponde su stdout
+    con "OK\t<percorso>", "FAIL\t<percorso>" o "SKIP\t<percorso>" (output già generato) per ciascuno.
+    Ritorna la tupla (successi, fallimenti); i file saltati non sono conteggiati."""
+    success_count = 0
+    fail_count = 0
+    with progress:
+        for line in sys.stdin:
+            path_text = line.strip()
+            if not path_text:
+                continue
+            file_path = Path(path_text).absolute()
+            status = "FAIL"
+            if is_generated_output(file_path.name):
+                # Come per il singolo file da riga di comando: saltato, non è un errore
+                console.print(f"[yellow]Saltato:[/yellow] {file_path.name} sembra un output già generato.")
+                status = "SKIP"
+            elif file_path.is_file() and file_path.suffix.lower() == '.dat':
+                try:
+                    if process_dat_file(file_path, score_threshold):
+                        status = "OK"
+                except Exception as e:
+                    console.print(f"[red]Errore inaspettato durante l'elaborazione di {file_path.name}:[/red] {e}", style="bold red")
+            else:
+                console.print(f"[red]Errore:[/red] File '{path_text}' non valido o non trovato.", style="bold red")
+            if status == "OK":
+                success_count += 1
+            elif status == "FAIL":
+                fail_count += 1
+            sys.stdout.write(f"{status}\t{path_text}\n")
+            sys.stdout.flush()
+    return success_count, fail_count
+
+@functools.cache
+def _script_dir():
+    """Directory (risolta) dello script, calcolata una sola volta."""
+    return Path(__file__).parent.resolve()
+
+def iter_dat_files(directory):
+    """Genera i file .dat da processare nella directory man mano che os.scandir li trova (esclusi output e file di debug)."""
+    # I nomi sono filtrati prima di creare oggetti Path
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith('.dat') or is_generated_output(name):
+                continue
+            if entry.is_file():
+                yield Path(entry.path)
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=f"Gemini AKNF Roms Filter Script v{SCRIPT_VERSION}")
@@ -626,15 +1080,38 @@ if __name__ == "__main__":
                         help="Percorso del file .dat specifico da processare.")
     parser.add_argument("-s", "--score_threshold", type=int, default=75,
                         help="Soglia minima del punteggio stimato per la critica (default: 75). Valori più bassi includeranno più giochi.")
+    parser.add_argument("-w", "--workers", type=int, default=4,
+                        help="Numero di file DAT elaborati in parallelo (default: 4).")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processi usati per il parsing dei DAT quando si elaborano più file (default: numero di CPU, 0 = parsing nel processo principale).")
+    parser.add_argument("--rpm", type=int, default=GEMINI_RPM_LIMIT,
+                        help=f"Massimo di richieste al minuto verso l'API Gemini (default: {GEMINI_RPM_LIMIT}, 0 = nessun limite).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Non usa né aggiorna la cache su disco (risposte Gemini e DAT filtrati già prodotti).")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+                        help=f"Directory della cache delle risposte Gemini e dei risultati (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--pretty", action=argparse.BooleanOptionalAction, default=False,
+                        help="Riformatta l'intero DAT finale con lxml (più lento, default: disattivato). In alternativa: xmllint --format.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Resta in esecuzione e processa i percorsi .dat letti da stdin, uno per riga (es. find . -name '*.dat' | python ai_aknf_filter.py --daemon). "
+                             "Su stdout solo le risposte OK/FAIL/SKIP<tab>percorso, i messaggi vanno su stderr.")
 
     args = parser.parse_args()
+    if args.daemon and (args.filename or args.all):
+        parser.error("--daemon legge i percorsi da stdin: non è combinabile con un file o con --all")
+    if args.daemon:
+        # In modalità daemon stdout trasporta solo le risposte del protocollo: i messaggi vanno su stderr
+        console, progress = create_console(stderr=True)
+    api_rate_limiter = RateLimiter(args.rpm)
+    response_cache_dir = None if args.no_cache else args.cache_dir
+    pretty_print_output = args.pretty
 
     if not RICH_AVAILABLE:
-        print(f"Gemini AKNF Roms Filter Script v{SCRIPT_VERSION}")
-        print("Avviso: Libreria 'rich' non trovata. L'output non sarà colorato.")
-        print("Installala con: pip install rich")
+        console.print(f"Gemini AKNF Roms Filter Script v{SCRIPT_VERSION}")
+        console.print("Avviso: Libreria 'rich' non trovata. L'output non sarà colorato.")
+        console.print("Installala con: pip install rich")
     if not LXML_AVAILABLE:
-         print("Avviso: Libreria 'lxml' non trovata. Si raccomanda 'pip install lxml'.")
+         console.print("Avviso: Libreria 'lxml' non trovata. Si raccomanda 'pip install lxml'.")
 
 
     console.print(Panel(f"Gemini AKNF Roms Filter Script [bold]v{SCRIPT_VERSION}[/bold] (Modello: {GEMINI_MODEL_NAME})",
@@ -645,50 +1122,76 @@ if __name__ == "__main__":
     total_to_process = 0
     files_to_process = []
 
-    if args.filename:
-        file_path = args.filename.resolve()
+    if args.daemon:
+        console.print("Modalità daemon: in attesa di percorsi .dat su stdin (uno per riga, EOF per terminare).")
+    elif args.filename:
+        # Basta un percorso assoluto: nessuna risoluzione dei link simbolici (nessuna syscall)
+        file_path = args.filename.absolute()
         if file_path.is_file() and file_path.suffix.lower() == '.dat':
-            files_to_process.append(file_path)
-            total_to_process = 1
+            # Stesso filtro di --all: un output già generato non va riparsato né inviato all'IA
+            if is_generated_output(file_path.name):
+                console.print(f"[yellow]Saltato:[/yellow] {file_path.name} sembra un output già generato.")
+                sys.exit(0)
+            dat_files = [file_path]
         else:
             console.print(f"[red]Errore:[/red] File specificato '{args.filename}' non valido o non trovato.", style="bold red")
             sys.exit(1)
     elif args.all:
-        script_dir = Path(__file__).parent.resolve()
+        script_dir = _script_dir()
         console.print(f"Ricerca file .dat in: [cyan]{script_dir}[/cyan]")
-        all_dats = list(script_dir.glob('*.dat'))
-        files_to_process = [
-            f for f in all_dats
-            if "(GeminiAKNF" not in f.name and
-               not f.name.endswith(("_compressed.xml", "_ai_response.xml",
-                                    "failed_ai_response_games.xml",
-                                    "invalid_ai_response_start.xml",
-                                    "failed_ai_response.xml"))
-        ]
-        total_to_process = len(files_to_process)
-        if not files_to_process:
-            console.print("[yellow]Nessun file .dat valido trovato da processare nella directory.[/yellow]")
-        else:
-            console.print(f"Trovati [bold cyan]{total_to_process}[/bold cyan] file .dat da processare:")
-            files_to_process.sort(key=lambda p: p.name)
-            for dat_file in files_to_process:
-                console.print(f"- [dim]{dat_file.name}[/dim]")
+        dat_files = iter_dat_files(script_dir)
     else:
         console.print("[red]Errore:[/red] Specificare un percorso file o usare l'opzione --all.", style="bold red")
         parser.print_help()
         sys.exit(1)
 
-    if files_to_process:
+    if args.daemon:
+        success_count, fail_count = run_daemon(args.score_threshold)
+        total_to_process = success_count + fail_count
+    else:
         console.rule(f"Inizio Elaborazione File (Soglia Punteggio: {args.score_threshold})", style="blue")
-        for i, dat_file in enumerate(files_to_process):
-            # Passa la soglia letta dagli argomenti
-            if process_dat_file(dat_file, args.score_threshold):
-                success_count += 1
+        # Il parsing (CPU-bound) di più file usa un pool di processi; forkserver/spawn evitano il fork
+        # di un processo con thread già attivi (e avviano i processi solo quando servono)
+        parse_pool = None
+        if args.parse_workers > 0 and not args.filename:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            parse_pool = ProcessPoolExecutor(max_workers=min(args.parse_workers, max(1, args.workers)),
+                                             mp_context=multiprocessing.get_context(start_method))
+        try:
+            # Le chiamate API dominano il tempo di elaborazione: i file vengono processati in parallelo.
+            # La ricerca dei file alimenta direttamente l'executor: il primo file parte appena trovato.
+            with progress, ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+                # Passa la soglia letta dagli argomenti
+                futures = {executor.submit(process_dat_file, dat_file, args.score_threshold, parse_pool): dat_file
+                           for dat_file in dat_files}
+                files_to_process = list(futures.values())
+                total_to_process = len(files_to_process)
+                results = []
+                for future in as_completed(futures):
+                    try:
+                        results.append(bool(future.result()))
+                    except Exception as e:
+                        console.print(f"[red]Errore inaspettato durante l'elaborazione di {futures[future].name}:[/red] {e}", style="bold red")
+                        results.append(False)
+            # Conteggio unico a fine elaborazione
+            tally = collections.Counter(results)
+            success_count = tally[True]
+            fail_count = tally[False]
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+        if not args.filename:
+            if not files_to_process:
+                console.print("[yellow]Nessun file .dat valido trovato da processare nella directory.[/yellow]")
             else:
-                fail_count += 1
-            if total_to_process > 1 and i < total_to_process - 1:
-                console.print("\n[dim]Pausa breve prima del prossimo file...[/dim]")
-                time.sleep(1) # Pausa breve
+                console.print(f"Trovati [bold cyan]{total_to_process}[/bold cyan] file .dat, elaborati:")
+                files_to_process.sort(key=operator.attrgetter('name'))
+                # Una sola stampa (senza auto-highlight di rich), elenco troncato per directory molto grandi
+                listed_files = [f"- [dim]{dat_file.name}[/dim]" for dat_file in files_to_process[:10]]
+                if total_to_process > 10:
+                    listed_files.append(f"  [dim]... e altri {total_to_process - 10}[/dim]")
+                console.print("\n".join(listed_files), highlight=False)
 
     summary_style = "green" if fail_count == 0 and total_to_process > 0 else ("yellow" if success_count > 0 else "red")
     fail_color = "red" if fail_count > 0 else "white"